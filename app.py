@@ -3,28 +3,48 @@ import re
 import time
 import sqlite3
 import html
+import orjson
 import threading
+from functools import lru_cache
 import requests
+from queue import Queue, Empty
+from collections import deque
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 import pymupdf
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
+from urllib.parse import urljoin, urlparse, urlsplit
 from urllib import robotparser
 from flask import (
     Flask, request, jsonify, render_template, g,
-    redirect, url_for, session
+    redirect, url_for, session, Response, stream_with_context
 )
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.security import check_password_hash
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
 
 # >>> NEW: import DB utilities <<<
 from db import (
-    DATABASE, get_db, init_db, close_db, open_raw_connection
+    DATABASE, get_db, init_db, close_db, open_raw_connection, hash_password,
+    compress_text, decompress_text
 )
 
 # -------------------- FLASK CONFIG --------------------
+class OrjsonProvider(DefaultJSONProvider):
+    """Serve jsonify()/request.json through orjson."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__, template_folder="templates", static_folder="static")
+app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev-secret-change-me")
 
 # -------------------- MODEL & API CONFIG --------------------
@@ -32,15 +52,37 @@ GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
 GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
 MODEL_NAME = "meta-llama/llama-4-scout-17b-16e-instruct"
 
-# -------------------- UPLOADED PDF BUFFER --------------------
-uploaded_pdf_text = ""
+# -------------------- UPLOADED PDFS --------------------
+PDF_CHUNK_WORDS = 500    # uploaded PDFs are stored per user in chunks of ~this many words
+PDF_CONTEXT_CHUNKS = 3   # chunks of the user's PDF sent to the model per question
 
 # -------------------- SCRAPER CONFIG --------------------
 START_ROOT = "kiit.ac.in"
 MAX_PAGES_DEFAULT = int(os.environ.get("KIIT_SCRAPE_MAX", 150))
 DELAY_DEFAULT = float(os.environ.get("KIIT_SCRAPE_DELAY", 0.8))
+FLUSH_EVERY_PAGES = 50     # commit scraped pages in batches of this size...
+FLUSH_EVERY_SECONDS = 2.0  # ...or at least this often
+MAX_PDF_BYTES = 20_000_000  # skip crawled PDFs larger than this
+SCRAPE_WORKERS = int(os.environ.get("KIIT_SCRAPE_WORKERS", 8))
 USER_AGENT = "SuperGPT-Scraper/1.3 (local-dev; polite crawler)"
 
+# -------------------- HTTP SESSIONS --------------------
+def make_http_session(pool_size: int = 32, retries: int = 2, headers=None) -> requests.Session:
+    """Return a requests.Session with a pooled, keep-alive adapter mounted for http/https."""
+    sess = requests.Session()
+    if headers:
+        sess.headers.update(headers)
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size,
+        max_retries=Retry(total=retries, backoff_factor=0.2)
+    )
+    sess.mount("https://", adapter)
+    sess.mount("http://", adapter)
+    return sess
+
+# reused across chat requests so the Groq TLS connection stays warm
+_groq_session = make_http_session(pool_size=16, retries=0)
+
 # -------------------- APP TEARDOWN --------------------
 @app.teardown_appcontext
 def teardown_db(_exc):
@@ -60,32 +102,81 @@ def login_required(fn):
 def clean_text(s: str) -> str:
     if not s:
         return ""
-    s = html.unescape(s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    return " ".join(html.unescape(s).split())
+
+NON_CONTENT_SELECTOR = "script, style, noscript, header, footer, svg, meta, nav"
 
-def visible_text(html_content: str) -> str:
-    soup = BeautifulSoup(html_content, "html.parser")
-    for tag in soup(["script", "style", "noscript", "header", "footer", "svg", "meta", "nav"]):
-        tag.decompose()
-    return clean_text(soup.get_text(separator=" "))
+def visible_text(tree) -> str:
+    """Strip non-content tags from a parsed tree (or raw HTML) and return its body text."""
+    if isinstance(tree, (str, bytes)):
+        tree = LexborHTMLParser(tree)
+    for node in tree.css(NON_CONTENT_SELECTOR):
+        node.decompose()
+    if tree.body is None:
+        return ""
+    return clean_text(tree.body.text(separator=" "))
 
+def pdf_text(data: bytes) -> str:
+    """Extract text page by page, skipping pages that carry no fonts (scans, images)."""
+    doc = pymupdf.open(stream=data, filetype="pdf")
+    try:
+        parts = []
+        for page in doc:
+            if page.get_fonts():
+                parts.append(page.get_text("text", sort=False))
+        return "\n".join(parts)
+    finally:
+        doc.close()
+
+def chunk_text(text: str, max_words=PDF_CHUNK_WORDS):
+    """Group paragraphs into chunks of at most max_words words (long paragraphs are split)."""
+    chunks, current = [], []
+    for para in re.split(r"\n\s*\n", text):
+        words = para.split()
+        while len(words) > max_words:
+            chunks.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        if current and len(current) + len(words) > max_words:
+            chunks.append(" ".join(current))
+            current = []
+        current.extend(words)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_INDEX_PAGE_RE = re.compile(r"/index\.(?:html?|php)$", re.I)
+
+# the same nav/footer links show up on nearly every page, so memoize URL handling
+@lru_cache(maxsize=200_000)
 def normalize_url(base: str, link: str) -> str:
-    joined = urljoin(base, link)
-    p = urlparse(joined)
-    return f"{p.scheme}://{p.netloc}{p.path}"
-
-def upsert_page(db_conn, url: str, title: str, content: str):
-    c = db_conn.cursor()
-    c.execute("""
-        INSERT INTO scraped_pages (url, title, content, fetched_at)
-        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        ON CONFLICT(url) DO UPDATE SET
-            title=excluded.title,
-            content=excluded.content,
-            fetched_at=CURRENT_TIMESTAMP
-    """, (url, title, content))
-    db_conn.commit()
+    """
+    Resolve link against base and canonicalize it so near-duplicates collapse:
+    lowercase scheme/host, drop default ports, query and fragment, and map
+    empty paths and trailing index pages to their directory.
+    """
+    p = urlsplit(urljoin(base, link))
+    scheme = p.scheme.lower()
+    host = (p.hostname or "").lower()
+    if p.port and p.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{p.port}"
+    path = _INDEX_PAGE_RE.sub("/", p.path) or "/"
+    return f"{scheme}://{host}{path}"
+
+def upsert_pages(db_conn, rows):
+    """Write a batch of (url, title, content) rows in a single transaction."""
+    if not rows:
+        return
+    rows = [(url, title, compress_text(content)) for url, title, content in rows]
+    with db_conn:
+        db_conn.executemany("""
+            INSERT INTO scraped_pages (url, title, content_zst, fetched_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(url) DO UPDATE SET
+                title=excluded.title,
+                content_zst=excluded.content_zst,
+                fetched_at=CURRENT_TIMESTAMP
+        """, rows)
 
 # -------------------- ROUTES: SEPARATED UI --------------------
 @app.route("/")
@@ -143,7 +234,7 @@ def register():
 
         c.execute(
             "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
-            (username, email, generate_password_hash(password))
+            (username, email, hash_password(password))
         )
         db.commit()
 
@@ -164,17 +255,24 @@ def logout():
 @app.route("/upload", methods=["POST"])
 @login_required
 def upload_pdf():
-    global uploaded_pdf_text
     if "file" not in request.files:
         return jsonify({"message": "No file uploaded"}), 400
     file = request.files["file"]
     if file.filename == "" or not file.filename.lower().endswith(".pdf"):
         return jsonify({"message": "Invalid file type"}), 400
     try:
-        doc = pymupdf.open(stream=file.read(), filetype="pdf")
-        text = "\n".join([page.get_text("text") for page in doc])
-        uploaded_pdf_text = text if text.strip() else "No text found in PDF."
-        return jsonify({"message": "PDF uploaded successfully"})
+        chunks = chunk_text(pdf_text(file.read()))
+        if not chunks:
+            return jsonify({"message": "No text found in PDF."}), 400
+        # each upload replaces the user's previous PDF
+        db = get_db()
+        with db:
+            db.execute("DELETE FROM user_pdfs WHERE user_id = ?", (session["user_id"],))
+            db.executemany(
+                "INSERT INTO user_pdfs (user_id, chunk_id, text) VALUES (?, ?, ?)",
+                [(session["user_id"], i, chunk) for i, chunk in enumerate(chunks)]
+            )
+        return jsonify({"message": "PDF uploaded successfully", "chunks": len(chunks)})
     except Exception as e:
         return jsonify({"message": f"Error processing PDF: {str(e)}"}), 500
 
@@ -185,12 +283,108 @@ _scrape_state = {
     "last_url": None, "error": None
 }
 
+@lru_cache(maxsize=200_000)
+def in_scope(url: str) -> bool:
+    return urlparse(url).netloc.endswith(START_ROOT)
+
+def make_throttle(interval: float):
+    """
+    Token bucket on the monotonic clock: the returned function blocks until the
+    caller's slot, spacing calls at least `interval` apart across all threads.
+    """
+    lock = threading.Lock()
+    next_ok = time.monotonic()
+
+    def throttle():
+        nonlocal next_ok
+        with lock:
+            now = time.monotonic()
+            slot = max(now, next_ok)
+            next_ok = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    return throttle
+
 def can_fetch_url(url: str, rp: robotparser.RobotFileParser) -> bool:
     try:
         return rp.can_fetch(USER_AGENT, url)
     except Exception:
         return True
 
+def fetch_page(sess: requests.Session, url: str, throttle):
+    """
+    Fetch and parse a single URL (runs on a pool worker).
+    Returns (title, content, links) or None if the page is unusable.
+    """
+    throttle()
+    resp = sess.get(url, timeout=15, stream=False)
+    if resp.status_code != 200:
+        return None
+
+    ctype = (resp.headers.get("content-type") or "").lower()
+    content, title, links = "", url, []
+
+    if "pdf" in ctype or url.lower().endswith(".pdf"):
+        if len(resp.content) > MAX_PDF_BYTES:
+            return None
+        try:
+            content = pdf_text(resp.content)
+            title = url.split("/")[-1] or url
+        except Exception:
+            return None
+    elif "text" in ctype or "html" in ctype:
+        # hand lexbor the raw bytes unless the server declared a non-UTF-8 charset;
+        # saves decoding the whole page (inline scripts included) into a str first
+        charset = resp.encoding if "charset=" in ctype else ""
+        if (charset or "").lower().replace("-", "") not in ("", "utf8", "ascii", "usascii"):
+            tree = LexborHTMLParser(resp.text)
+        else:
+            tree = LexborHTMLParser(resp.content)
+        title_node = tree.css_first("title")
+        title = (title_node.text(strip=True) if title_node else "") or url
+        # collect links before visible_text() drops <nav>/<header>/<footer>
+        for a in tree.css("a[href]"):
+            href = a.attributes.get("href") or ""
+            if not href or href.startswith(("mailto:", "tel:", "javascript:")):
+                continue
+            normalized = normalize_url(resp.url, href)
+            if in_scope(normalized):
+                links.append(normalized)
+        content = visible_text(tree)
+    else:
+        return None
+
+    return title, content, links
+
+def page_writer(write_q: Queue):
+    """
+    Single SQLite writer for the scraper: drains (url, title, content) rows
+    from write_q in batches until a None sentinel arrives.
+    """
+    db_conn = open_raw_connection()
+    batch, last_flush, done = [], time.monotonic(), False
+    try:
+        while not done:
+            try:
+                item = write_q.get(timeout=FLUSH_EVERY_SECONDS)
+            except Empty:
+                item = ()
+            if item is None:
+                done = True
+            elif item:
+                batch.append(item)
+            if batch and (done or len(batch) >= FLUSH_EVERY_PAGES
+                          or time.monotonic() - last_flush >= FLUSH_EVERY_SECONDS):
+                try:
+                    upsert_pages(db_conn, batch)
+                    _scrape_state["pages_saved"] += len(batch)
+                except Exception as e:
+                    _scrape_state["error"] = str(e)
+                batch, last_flush = [], time.monotonic()
+    finally:
+        db_conn.close()
+
 def background_scrape(start_url: str, max_pages: int, delay: float):
     global _scrape_state
     _scrape_state.update({
@@ -198,10 +392,11 @@ def background_scrape(start_url: str, max_pages: int, delay: float):
         "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
         "finished_at": None, "error": None
     })
+    sess = make_http_session(headers={"User-Agent": USER_AGENT})
+    write_q = Queue()
+    writer = threading.Thread(target=page_writer, args=(write_q,), daemon=True)
+    writer.start()
     try:
-        # >>> changed: use a raw connection from db.py for thread <<<
-        db_conn = open_raw_connection()
-
         rp = robotparser.RobotFileParser()
         try:
             rp.set_url(urljoin(start_url, "/robots.txt"))
@@ -209,66 +404,55 @@ def background_scrape(start_url: str, max_pages: int, delay: float):
         except Exception:
             pass
 
-        headers = {"User-Agent": USER_AGENT}
-        visited = set()
-        queue = [start_url]
-        root = START_ROOT
-
-        while queue and len(visited) < max_pages and _scrape_state["running"]:
-            url = queue.pop(0)
-            if url in visited:
-                continue
-            visited.add(url)
-            _scrape_state["last_url"] = url
-
-            if not urlparse(url).netloc.endswith(root):
-                continue
-            if not can_fetch_url(url, rp):
-                time.sleep(delay); continue
-
-            try:
-                resp = requests.get(url, headers=headers, timeout=15)
-                if resp.status_code != 200:
-                    time.sleep(delay); continue
-
-                ctype = (resp.headers.get("content-type") or "").lower()
-                content, title, soup = "", url, None
-
-                if "pdf" in ctype or url.lower().endswith(".pdf"):
+        # seen/queue are only touched by this coordinating thread;
+        # pool workers just fetch and parse. URLs are de-duplicated when
+        # enqueued, so the frontier never holds the same page twice.
+        start_url = normalize_url(start_url, "")
+        seen = {start_url}
+        queue = deque([start_url])
+        visited = 0
+        in_flight = {}
+        # only real HTTP requests spend the politeness budget, which stays at
+        # SCRAPE_WORKERS requests per `delay` seconds
+        throttle = make_throttle(delay / SCRAPE_WORKERS)
+
+        with ThreadPoolExecutor(max_workers=SCRAPE_WORKERS) as pool:
+            while _scrape_state["running"]:
+                while queue and len(in_flight) < SCRAPE_WORKERS and visited < max_pages:
+                    url = queue.popleft()
+                    visited += 1
+                    if not in_scope(url):
+                        continue
+                    if not can_fetch_url(url, rp):
+                        continue
+                    _scrape_state["last_url"] = url
+                    in_flight[pool.submit(fetch_page, sess, url, throttle)] = url
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    url = in_flight.pop(fut)
                     try:
-                        doc = pymupdf.open(stream=resp.content, filetype="pdf")
-                        content = "\n".join([p.get_text("text") for p in doc])
-                        title = url.split("/")[-1] or url
+                        page = fut.result()
                     except Exception:
-                        time.sleep(delay); continue
-                elif "text" in ctype or "html" in ctype:
-                    html_text = resp.text
-                    soup = BeautifulSoup(html_text, "html.parser")
-                    title = soup.title.string.strip() if soup.title and soup.title.string else url
-                    content = visible_text(html_text)
-                else:
-                    time.sleep(delay); continue
-
-                if content.strip():
-                    upsert_page(db_conn, url, title, content)
-                    _scrape_state["pages_saved"] += 1
-
-                if soup is not None:
-                    for a in soup.find_all("a", href=True):
-                        href = a.get("href")
-                        if href.startswith(("mailto:", "tel:", "javascript:")):
-                            continue
-                        normalized = normalize_url(url, href)
-                        if urlparse(normalized).netloc.endswith(root) and normalized not in visited:
-                            queue.append(normalized)
-
-                time.sleep(delay)
-            except Exception:
-                time.sleep(delay)
-                continue
+                        continue
+                    if page is None:
+                        continue
+                    title, content, links = page
+                    if content.strip():
+                        write_q.put((url, title, content))
+                    for link in links:
+                        if link not in seen:
+                            seen.add(link)
+                            queue.append(link)
     except Exception as e:
         _scrape_state["error"] = str(e)
     finally:
+        write_q.put(None)
+        writer.join()
+        sess.close()
         _scrape_state["running"] = False
         _scrape_state["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
 
@@ -297,41 +481,98 @@ def scrape_stop():
     return jsonify({"message": "Stop signal sent", "status": _scrape_state})
 
 # -------------------- TF-IDF --------------------
-_tfidf_vectorizer = None
+# Term counts come from a HashingVectorizer (no vocabulary), so new pages can be
+# vectorized on their own and stacked onto the existing matrix; only the cheap
+# IDF re-weighting runs over the whole corpus.
+_hash_vectorizer = HashingVectorizer(
+    n_features=2**18, alternate_sign=False, norm=None, stop_words="english"
+)
+_tfidf_transformer = None
+_tfidf_counts = None
 _tfidf_matrix = None
 _tfidf_rows = []
-_last_index_count = 0
+_tfidf_pos = {}          # scraped_pages.id -> row position in _tfidf_matrix
+_last_indexed_id = 0
+FTS_CANDIDATES = 200     # FTS5 pre-filter size before TF-IDF scoring
+INDEX_PARALLEL_MIN_DOCS = 2000  # below this a process pool costs more than it saves
+INDEX_CHUNK_DOCS = 256          # documents per pool task
+_index_lock = threading.Lock()
+
+def vectorize_docs(docs):
+    """clean_text + hash raw documents (module-level so pool workers can run it)."""
+    return _hash_vectorizer.transform([clean_text(d) for d in docs])
+
+def vectorize_docs_parallel(docs):
+    """Spread vectorize_docs over a process pool for large batches (full rebuilds)."""
+    workers = os.cpu_count() or 1
+    if (workers < 2 or len(docs) < INDEX_PARALLEL_MIN_DOCS
+            or "fork" not in multiprocessing.get_all_start_methods()):
+        return vectorize_docs(docs)
+    chunks = [docs[i:i + INDEX_CHUNK_DOCS] for i in range(0, len(docs), INDEX_CHUNK_DOCS)]
+    # fork so workers inherit the vectorizer instead of re-importing the app
+    ctx = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as ex:
+        return sparse.vstack(list(ex.map(vectorize_docs, chunks))).tocsr()
+
+def _add_to_index(rows):
+    global _tfidf_transformer, _tfidf_counts, _tfidf_matrix, _last_indexed_id
+    if rows:
+        rows = [
+            {"id": r["id"], "url": r["url"], "title": r["title"],
+             "content": decompress_text(r["content_zst"])}
+            for r in rows
+        ]
+        new_counts = vectorize_docs_parallel(
+            [(r["title"] or "") + " " + (r["content"] or "") for r in rows]
+        )
+        if _tfidf_counts is None:
+            _tfidf_counts = new_counts
+        else:
+            _tfidf_counts = sparse.vstack([_tfidf_counts, new_counts]).tocsr()
+        for r in rows:
+            _tfidf_pos[r["id"]] = len(_tfidf_rows)
+            _tfidf_rows.append({"url": r["url"], "title": r["title"], "content": r["content"]})
+        _last_indexed_id = max(_last_indexed_id, max(r["id"] for r in rows))
+    if _tfidf_counts is None:
+        _tfidf_transformer = None
+        _tfidf_matrix = None
+    else:
+        _tfidf_transformer = TfidfTransformer()
+        _tfidf_matrix = _tfidf_transformer.fit_transform(_tfidf_counts)
+    return {"indexed_pages": len(_tfidf_rows)}
 
 def build_tfidf_index():
-    global _tfidf_vectorizer, _tfidf_matrix, _tfidf_rows, _last_index_count
-    db = get_db()
-    c = db.cursor()
-    c.execute("SELECT url, title, content FROM scraped_pages")
-    rows = c.fetchall()
-    docs = []
-    _tfidf_rows = []
-    for r in rows:
-        text = clean_text((r["title"] or "") + " " + (r["content"] or ""))
-        docs.append(text)
-        _tfidf_rows.append({"url": r["url"], "title": r["title"], "content": r["content"]})
-    if not docs:
-        _tfidf_vectorizer = None
-        _tfidf_matrix = None
-        _last_index_count = 0
-        return {"indexed_pages": 0}
-    _tfidf_vectorizer = TfidfVectorizer(stop_words="english", max_features=50000)
-    _tfidf_matrix = _tfidf_vectorizer.fit_transform(docs)
-    _last_index_count = len(docs)
-    return {"indexed_pages": _last_index_count}
+    """Full rebuild from every row in scraped_pages."""
+    global _tfidf_counts, _tfidf_rows, _tfidf_pos, _last_indexed_id
+    with _index_lock:
+        db = get_db()
+        c = db.cursor()
+        c.execute("SELECT id, url, title, content_zst FROM scraped_pages ORDER BY id")
+        rows = c.fetchall()
+        _tfidf_counts = None
+        _tfidf_rows = []
+        _tfidf_pos = {}
+        _last_indexed_id = 0
+        return _add_to_index(rows)
 
 def ensure_index_up_to_date():
+    """Vectorize only pages added since the last index; fall back to a rebuild if rows vanished."""
     db = get_db()
     c = db.cursor()
-    c.execute("SELECT COUNT(*) AS n FROM scraped_pages")
-    n = c.fetchone()["n"]
-    if n != _last_index_count or _tfidf_vectorizer is None or _tfidf_matrix is None:
-        return build_tfidf_index()
-    return {"indexed_pages": _last_index_count}
+    with _index_lock:
+        c.execute("SELECT COUNT(*) AS n FROM scraped_pages")
+        n = c.fetchone()["n"]
+        if _tfidf_matrix is not None and n == len(_tfidf_rows):
+            return {"indexed_pages": len(_tfidf_rows)}
+        if n > len(_tfidf_rows):
+            c.execute(
+                "SELECT id, url, title, content_zst FROM scraped_pages WHERE id > ? ORDER BY id",
+                (_last_indexed_id,)
+            )
+            info = _add_to_index(c.fetchall())
+            if info["indexed_pages"] == n:
+                return info
+    return build_tfidf_index()
 
 @app.route("/reindex", methods=["POST"])
 @login_required
@@ -339,18 +580,57 @@ def reindex_endpoint():
     info = build_tfidf_index()
     return jsonify({"message": "TF-IDF index rebuilt", **info})
 
+def top_indices(sims, top_n):
+    """Indices of the top_n scores, best first, without sorting the whole array."""
+    if top_n < len(sims):
+        top = np.argpartition(-sims, top_n)[:top_n]
+    else:
+        top = np.arange(len(sims))
+    return top[np.argsort(-sims[top], kind="stable")]
+
+def fts_candidates(query: str, limit=FTS_CANDIDATES):
+    """
+    Ask the FTS5 index for the best-matching scraped_pages ids.
+    Returns None when FTS is unavailable or nothing matches, meaning "score everything".
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return None
+    match = " OR ".join(f'"{t}"' for t in terms)
+    try:
+        rows = get_db().execute(
+            "SELECT rowid FROM scraped_pages_fts WHERE scraped_pages_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    return [r[0] for r in rows] or None
+
 def retrieve_tfidf(query: str, top_n=5):
     if not query.strip():
         return []
     ensure_index_up_to_date()
-    if _tfidf_vectorizer is None or _tfidf_matrix is None or not _tfidf_rows:
+    with _index_lock:
+        transformer, matrix, rows, pos = _tfidf_transformer, _tfidf_matrix, _tfidf_rows, _tfidf_pos
+    if transformer is None or matrix is None or not rows:
         return []
-    q_vec = _tfidf_vectorizer.transform([query])
-    sims = cosine_similarity(q_vec, _tfidf_matrix).ravel()
-    idxs = sims.argsort()[::-1][:top_n]
+    q_vec = transformer.transform(_hash_vectorizer.transform([query]))
+
+    # score only the FTS5 shortlist when there is one
+    cand_ids = fts_candidates(query)
+    subset = None
+    if cand_ids:
+        subset = np.array([pos[i] for i in cand_ids if i in pos], dtype=np.intp)
+        if subset.size:
+            matrix = matrix[subset]
+        else:
+            subset = None
+    # rows and query are already L2-normalised, so the dot product is the cosine
+    sims = (matrix @ q_vec.T).toarray().ravel()
+    idxs = top_indices(sims, top_n)
     results = []
     for i in idxs:
-        row = _tfidf_rows[i]
+        row = rows[subset[i] if subset is not None else i]
         snippet = clean_text((row["content"] or "")[:800])
         results.append({
             "url": row["url"], "title": row["title"],
@@ -358,23 +638,96 @@ def retrieve_tfidf(query: str, top_n=5):
         })
     return results
 
+def retrieve_pdf_chunks(user_id, query: str, top_n=PDF_CONTEXT_CHUNKS):
+    """Best-matching chunks of this user's uploaded PDF, in document order."""
+    rows = get_db().execute(
+        "SELECT text FROM user_pdfs WHERE user_id = ? ORDER BY chunk_id", (user_id,)
+    ).fetchall()
+    chunks = [r["text"] for r in rows]
+    if len(chunks) <= top_n:
+        return chunks
+    # a user's PDF is small, so weight it on the fly rather than in the shared index
+    tfidf = TfidfTransformer()
+    matrix = tfidf.fit_transform(_hash_vectorizer.transform(chunks))
+    q_vec = tfidf.transform(_hash_vectorizer.transform([query]))
+    sims = (matrix @ q_vec.T).toarray().ravel()
+    return [chunks[i] for i in sorted(top_indices(sims, top_n))]
+
 # -------------------- CHAT API --------------------
+def fallback_reply(relevant, err) -> str:
+    if relevant:
+        # graceful fallback with retrieved snippets
+        lines = ["I couldn't reach the AI backend. Here's relevant info I found:\n"]
+        for doc in relevant:
+            lines.append(f"- {doc['title']} ({doc['url']}): {doc['snippet'][:300]}...")
+        return "\n\n".join(lines)
+    return f"Temporary error: {err}"
+
+INSERT_CHAT_SQL = "INSERT INTO chat_history (user_message, bot_reply) VALUES (?, ?)"
+CHAT_WRITE_BATCH = 64        # max rows per chat_history transaction
+CHAT_WRITE_INTERVAL = 0.1    # seconds to wait for more rows before committing
+_chat_write_q = Queue()
+
+def save_chat(user_message: str, bot_reply: str):
+    """Queue a chat_history row; chat_writer() commits it off the request path."""
+    _chat_write_q.put((user_message, bot_reply))
+
+def chat_writer():
+    """Background thread: group queued chat_history rows into batched transactions."""
+    db_conn = open_raw_connection()
+    while True:
+        rows = [_chat_write_q.get()]
+        deadline = time.monotonic() + CHAT_WRITE_INTERVAL
+        while len(rows) < CHAT_WRITE_BATCH:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                rows.append(_chat_write_q.get(timeout=timeout))
+            except Empty:
+                break
+        try:
+            with db_conn:
+                db_conn.executemany(INSERT_CHAT_SQL, rows)
+        except sqlite3.Error:
+            app.logger.exception("Failed to save %d chat_history rows", len(rows))
+
+def sse(obj) -> str:
+    return f"data: {orjson.dumps(obj).decode()}\n\n"
+
+def stream_groq(payload, headers):
+    """Yield content deltas from Groq's OpenAI-compatible SSE stream."""
+    with _groq_session.post(GROQ_API_URL, headers=headers, data=orjson.dumps({**payload, "stream": True}),
+                            timeout=30, stream=True) as r:
+        r.raise_for_status()
+        r.encoding = "utf-8"
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            delta = orjson.loads(data)["choices"][0]["delta"].get("content")
+            if delta:
+                yield delta
+
 @app.route("/api/chat", methods=["POST"])
 @login_required
 def chat_api():
-    global uploaded_pdf_text
-    user_message = (request.json.get("message") or "").strip()
+    params = request.get_json(silent=True) or {}
+    user_message = (params.get("message") or "").strip()
     if not user_message:
         return jsonify({"reply": "Please enter a message."}), 400
 
     relevant = retrieve_tfidf(user_message, 5)
     relevant_text = "\n".join([f"{r['title']} - {r['url']}\n{r['snippet']}" for r in relevant])
+    pdf_context = "\n\n".join(retrieve_pdf_chunks(session["user_id"], user_message))
 
     system_prompt = (
         "You are KiitGPT, a chatbot for KIIT students. "
         "Use the following context from the KIIT website when helpful, and include the URL in answers:\n\n"
         f"{relevant_text}\n\n"
-        f"Uploaded PDF content (if any):\n\n{uploaded_pdf_text}"
+        f"Uploaded PDF content (if any):\n\n{pdf_context}"
     )
     payload = {
         "model": MODEL_NAME,
@@ -386,23 +739,33 @@ def chat_api():
     }
     headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
 
+    if params.get("stream"):
+        # Server-sent events: {"delta": "..."} chunks, then [DONE]
+        def generate():
+            parts = []
+            try:
+                for delta in stream_groq(payload, headers):
+                    parts.append(delta)
+                    yield sse({"delta": delta})
+            except Exception as e:
+                if not parts:
+                    parts.append(fallback_reply(relevant, e))
+                    yield sse({"delta": parts[0]})
+            save_chat(user_message, "".join(parts).strip())
+            yield "data: [DONE]\n\n"
+        return Response(
+            stream_with_context(generate()), mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
     try:
-        r = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
+        r = _groq_session.post(GROQ_API_URL, headers=headers, data=orjson.dumps(payload), timeout=30)
         r.raise_for_status()
-        bot_reply = r.json()["choices"][0]["message"]["content"].strip()
+        bot_reply = orjson.loads(r.content)["choices"][0]["message"]["content"].strip()
     except Exception as e:
-        if relevant:
-            # graceful fallback with retrieved snippets
-            lines = ["I couldn't reach the AI backend. Here's relevant info I found:\n"]
-            for doc in relevant:
-                lines.append(f"- {doc['title']} ({doc['url']}): {doc['snippet'][:300]}...")
-            bot_reply = "\n\n".join(lines)
-        else:
-            bot_reply = f"Temporary error: {e}"
+        bot_reply = fallback_reply(relevant, e)
 
-    db = get_db()
-    db.execute("INSERT INTO chat_history (user_message, bot_reply) VALUES (?, ?)", (user_message, bot_reply))
-    db.commit()
+    save_chat(user_message, bot_reply)
     return jsonify({"reply": bot_reply})
 
 # -------------------- HISTORY --------------------
@@ -416,6 +779,7 @@ def get_chat_history():
 # -------------------- INIT --------------------
 # Initialize DB once at startup
 init_db(app)
+threading.Thread(target=chat_writer, name="chat-writer", daemon=True).start()
 
 if __name__ == "__main__":
     app.run(debug=True)
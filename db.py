@@ -2,7 +2,10 @@
 
 import os
 import sqlite3
+import threading
+import zstandard as zstd
 from flask import g
+from werkzeug.security import generate_password_hash
 
 # -------------------- DATABASE --------------------
 DATA_DIR = "data"
@@ -10,17 +13,60 @@ os.makedirs(DATA_DIR, exist_ok=True)  # Create data folder if missing
 
 DATABASE = os.path.join(DATA_DIR, "chat_history.db")
 
+# Password hashing work factor (werkzeug method string). Stored hashes carry
+# their own method, so changing this never breaks existing logins.
+PW_HASH_METHOD = os.environ.get("PW_HASH_METHOD", "pbkdf2:sha256:60000")
+
+def hash_password(password: str) -> str:
+    return generate_password_hash(password, method=PW_HASH_METHOD)
+
+# scraped_pages.content_zst holds zstd-compressed UTF-8 page text.
+# zstd contexts are not thread-safe, so keep one pair per thread.
+ZSTD_LEVEL = 3
+_zstd_local = threading.local()
+
+def compress_text(text):
+    if text is None:
+        return None
+    cctx = getattr(_zstd_local, "cctx", None)
+    if cctx is None:
+        cctx = _zstd_local.cctx = zstd.ZstdCompressor(level=ZSTD_LEVEL)
+    return cctx.compress(text.encode("utf-8"))
+
+def decompress_text(blob):
+    if blob is None:
+        return None
+    dctx = getattr(_zstd_local, "dctx", None)
+    if dctx is None:
+        dctx = _zstd_local.dctx = zstd.ZstdDecompressor()
+    return dctx.decompress(blob).decode("utf-8")
+
+def _tune(conn):
+    """Apply per-connection PRAGMAs: WAL journaling, relaxed fsync, bigger page cache."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")      # ~64 MiB
+    conn.execute("PRAGMA mmap_size=268435456")    # 256 MiB
+    return conn
+
+def _connect():
+    conn = sqlite3.connect(DATABASE, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    # used by the scraped_pages_text view and the FTS sync triggers
+    conn.create_function("zstd_decompress", 1, decompress_text, deterministic=True)
+    return _tune(conn)
+
 def get_db():
     """Return a request-scoped SQLite connection (used inside Flask routes)."""
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE, check_same_thread=False)
-        db.row_factory = sqlite3.Row
+        db = g._database = _connect()
     return db
 
 def close_db(_exc=None):
     """Close the request-scoped connection at app teardown."""
-    db = getattr(g, "_database", None)
+    db = g.pop("_database", None)
     if db is not None:
         db.close()
 
@@ -33,13 +79,85 @@ def ensure_default_user(db):
     c = db.cursor()
     c.execute("SELECT COUNT(*) AS n FROM users")
     if c.fetchone()["n"] == 0:
-        from werkzeug.security import generate_password_hash
         c.execute(
             "INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)",
-            ("kiitian", "kiitian@supergpt.local", generate_password_hash("supergpt123"))
+            ("kiitian", "kiitian@supergpt.local", hash_password("supergpt123"))
         )
         db.commit()
 
+def migrate_page_content(db):
+    """
+    Move plain-text scraped_pages.content into compressed content_zst.
+    Drops the FTS index built on the old column so ensure_pages_fts() recreates it.
+    """
+    c = db.cursor()
+    if not column_exists(c, "scraped_pages", "content_zst"):
+        c.execute("ALTER TABLE scraped_pages ADD COLUMN content_zst BLOB")
+    c.execute("SELECT sql FROM sqlite_master WHERE name = 'scraped_pages_fts'")
+    row = c.fetchone()
+    if row and "content='scraped_pages'" in row["sql"]:
+        c.executescript("""
+            DROP TRIGGER IF EXISTS scraped_pages_ai;
+            DROP TRIGGER IF EXISTS scraped_pages_ad;
+            DROP TRIGGER IF EXISTS scraped_pages_au;
+            DROP TABLE IF EXISTS scraped_pages_fts;
+        """)
+    if column_exists(c, "scraped_pages", "content"):
+        c.execute("SELECT id, content FROM scraped_pages WHERE content IS NOT NULL AND content_zst IS NULL")
+        c.executemany(
+            "UPDATE scraped_pages SET content_zst = ? WHERE id = ?",
+            [(compress_text(r["content"]), r["id"]) for r in c.fetchall()]
+        )
+        try:
+            c.execute("ALTER TABLE scraped_pages DROP COLUMN content")
+        except sqlite3.OperationalError:
+            # SQLite < 3.35 has no DROP COLUMN; just free the space
+            c.execute("UPDATE scraped_pages SET content = NULL")
+    db.commit()
+
+def ensure_pages_fts(db):
+    """
+    Full-text index over scraped_pages, kept in sync by triggers. Page text is
+    read through the scraped_pages_text view, which decompresses content_zst.
+    Skipped silently if this SQLite build lacks FTS5.
+    """
+    c = db.cursor()
+    c.execute("""
+        CREATE VIEW IF NOT EXISTS scraped_pages_text AS
+        SELECT id, url, title, zstd_decompress(content_zst) AS content FROM scraped_pages
+    """)
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'scraped_pages_fts'")
+    if c.fetchone():
+        return
+    try:
+        c.execute("""
+            CREATE VIRTUAL TABLE scraped_pages_fts USING fts5(
+                url, title, content,
+                content='scraped_pages_text', content_rowid='id'
+            )
+        """)
+    except sqlite3.OperationalError:
+        return
+    c.executescript("""
+        CREATE TRIGGER IF NOT EXISTS scraped_pages_ai AFTER INSERT ON scraped_pages BEGIN
+            INSERT INTO scraped_pages_fts(rowid, url, title, content)
+            VALUES (new.id, new.url, new.title, zstd_decompress(new.content_zst));
+        END;
+        CREATE TRIGGER IF NOT EXISTS scraped_pages_ad AFTER DELETE ON scraped_pages BEGIN
+            INSERT INTO scraped_pages_fts(scraped_pages_fts, rowid, url, title, content)
+            VALUES ('delete', old.id, old.url, old.title, zstd_decompress(old.content_zst));
+        END;
+        CREATE TRIGGER IF NOT EXISTS scraped_pages_au AFTER UPDATE ON scraped_pages BEGIN
+            INSERT INTO scraped_pages_fts(scraped_pages_fts, rowid, url, title, content)
+            VALUES ('delete', old.id, old.url, old.title, zstd_decompress(old.content_zst));
+            INSERT INTO scraped_pages_fts(rowid, url, title, content)
+            VALUES (new.id, new.url, new.title, zstd_decompress(new.content_zst));
+        END;
+    """)
+    # index pages scraped before the FTS table existed
+    c.execute("INSERT INTO scraped_pages_fts(scraped_pages_fts) VALUES ('rebuild')")
+    db.commit()
+
 def init_db(app=None):
     """
     Create tables if missing and migrate schemas if needed.
@@ -82,12 +200,25 @@ def init_db(app=None):
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 url TEXT UNIQUE,
                 title TEXT,
-                content TEXT,
+                content_zst BLOB,
                 fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         """)
+
+        # uploaded PDF text, chunked, one set per user
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS user_pdfs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                text TEXT
+            )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_user_pdfs_user ON user_pdfs (user_id, chunk_id)")
         db.commit()
 
+        migrate_page_content(db)
+        ensure_pages_fts(db)
         ensure_default_user(db)
     finally:
         if ctx is not None:
@@ -98,6 +229,4 @@ def open_raw_connection():
     Return a standalone SQLite connection for background threads (not tied to g).
     Use this in the scraper thread.
     """
-    conn = sqlite3.connect(DATABASE, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return _connect()